@@ -3,6 +3,8 @@ import json
 from core.utils.llm_runtime import is_abort_blocked
 
 TAG = __name__
+# 停止消息只有session_id是变量，预先拼好模板，避免每次构造dict并完整编码
+_ABORT_TMPL = '{{"type": "tts", "state": "stop", "session_id": {sid}}}'
 
 
 async def handleAbortMessage(conn):
@@ -13,9 +15,7 @@ async def handleAbortMessage(conn):
     # 设置成打断状态，会自动打断llm、tts任务
     conn.client_abort = True
     conn.clear_queues()
-    # 打断客户端说话状态
-    await conn.websocket.send(
-        json.dumps({"type": "tts", "state": "stop", "session_id": conn.session_id})
-    )
     conn.clearSpeakStatus()
+    # 打断客户端说话状态
+    await conn.websocket.send(_ABORT_TMPL.format(sid=json.dumps(conn.session_id)))
     conn.logger.bind(tag=TAG).info("Abort message received-end")
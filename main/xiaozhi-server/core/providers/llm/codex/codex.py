@@ -1,14 +1,36 @@
-import json
 import os
 import re
+import selectors
 import subprocess
+import sys
 import threading
 import time
-from queue import Queue, Empty
+import weakref
+from collections import OrderedDict, deque
+
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import JSONDecoder
+
+    _DECODER = JSONDecoder()
+
+    def _json_loads(payload: bytes):
+        # payload已去掉首尾空白，直接raw_decode，跳过json.loads的编码探测和参数处理
+        text = payload.decode("utf-8")
+        value, end = _DECODER.raw_decode(text)
+        if end != len(text):
+            raise ValueError("Extra data")
+        return value
 
 from config.logger import setup_logging
 from core.providers.llm.base import LLMProviderBase
-from core.utils.llm_runtime import block_abort, unblock_abort
+from core.utils.llm_prompt import build_dialogue_prompt
+from core.utils.llm_runtime import (
+    block_abort,
+    register_session_cleanup,
+    unblock_abort,
+)
 from core.utils.llm_stream import wrap_status
 from .stderr_summary import summarize
 
@@ -19,6 +41,289 @@ _UUID_RE = re.compile(
     r"[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-"
     r"[0-9a-fA-F]{12}\b"
 )
+# 这些事件只携带对话内容（命令输出、推理、回复），其中出现的UUID不是会话ID
+_NO_SESSION_TYPES = frozenset(
+    {
+        "item.started",
+        "item.updated",
+        "item.completed",
+        "turn.started",
+        "turn.completed",
+    }
+)
+_SESSION_KEYS = (
+    "session_id",
+    "sessionId",
+    "conversation_id",
+    "conversationId",
+    "session",
+    "conversation",
+    "id",
+)
+_SESSION_KEYS_REVERSED = _SESSION_KEYS[::-1]
+_TEXT_KEYS = (
+    "text",
+    "content",
+    "message",
+    "output",
+    "delta",
+    "data",
+    "response",
+    "result",
+    "final",
+)
+# 按栈逆序压入，保证出栈顺序与_TEXT_KEYS一致
+_TEXT_KEYS_REVERSED = _TEXT_KEYS[::-1]
+# 事件type -> 文本提取函数；codex输出的事件类型有限，缓存很快就会饱和
+_HANDLER_CACHE = {}
+_HANDLER_CACHE_MAX = 256
+# 单轮内记住的stderr原始行数量上限
+_STDERR_SEEN_MAX = 128
+_SELECT_LIVENESS_INTERVAL = 1.0
+# JSON值可能的首字节：对象/数组/字符串，以及数字、true/false/null、NaN/Infinity等标量
+_JSON_START = frozenset(b'{["-0123456789tfnNI')
+# 回合结束或提前退出时等待codex退出的上限（秒），超时强杀
+_SHUTDOWN_TIMEOUT = 2.0
+# 同一次唤醒内到达的文本增量合并为一次yield，最长合并时间（秒）
+_COALESCE_WINDOW = 0.016
+
+
+def _split_lines(buf: bytearray):
+    start = 0
+    while True:
+        nl = buf.find(b"\n", start)
+        if nl < 0:
+            break
+        yield bytes(buf[start:nl])
+        start = nl + 1
+    if start:
+        del buf[:start]
+
+
+class _CodexWorker:
+    def __init__(self, key, proc):
+        self.key = key
+        self.proc = proc
+        self.idle_since = time.monotonic()
+
+    def _streams(self):
+        streams = (("stdout", self.proc.stdout), ("stderr", self.proc.stderr))
+        return [(name, stream) for name, stream in streams if stream]
+
+    def read_batches(self):
+        """按唤醒批量产出(name, line)列表，一批即一次select/事件唤醒时已就绪的全部行"""
+        if sys.platform == "win32":
+            # Windows下selectors不支持管道，退回到每个流一个读线程
+            yield from self._read_batches_threaded()
+            return
+        sel = selectors.DefaultSelector()
+        try:
+            for name, stream in self._streams():
+                fd = stream.fileno()
+                os.set_blocking(fd, False)
+                sel.register(fd, selectors.EVENT_READ, (name, bytearray()))
+            while sel.get_map():
+                events = sel.select(timeout=_SELECT_LIVENESS_INTERVAL)
+                if not events:
+                    # codex已退出但管道仍被其子进程持有时，不再无限等待EOF
+                    if self.proc.poll() is not None:
+                        break
+                    continue
+                batch = []
+                for key, _ in events:
+                    name, buf = key.data
+                    try:
+                        chunk = os.read(key.fd, 65536)
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        chunk = b""
+                    if not chunk:
+                        sel.unregister(key.fd)
+                        if buf:
+                            batch.append((name, bytes(buf)))
+                            buf.clear()
+                        continue
+                    buf += chunk
+                    batch.extend((name, line) for line in _split_lines(buf))
+                if batch:
+                    yield batch
+        finally:
+            sel.close()
+
+    def _read_batches_threaded(self):
+        # 读线程只做append，消费方只做popleft（deque两端操作线程安全），
+        # 用Event唤醒，省去Queue每次put/get的加锁和条件变量通知
+        lines = deque()
+        data_ready = threading.Event()
+
+        def reader(name, stream):
+            fd = stream.fileno()
+            buf = bytearray()
+            try:
+                while True:
+                    chunk = os.read(fd, 65536)
+                    if not chunk:
+                        break
+                    buf += chunk
+                    lines.extend((name, line) for line in _split_lines(buf))
+                    data_ready.set()
+                if buf:
+                    lines.append((name, bytes(buf)))
+            except (OSError, ValueError):
+                pass
+            finally:
+                lines.append((name, None))
+                data_ready.set()
+
+        streams = self._streams()
+        for name, stream in streams:
+            threading.Thread(target=reader, args=(name, stream), daemon=True).start()
+        pending = len(streams)
+        while pending:
+            data_ready.wait(_SELECT_LIVENESS_INTERVAL)
+            data_ready.clear()
+            batch = []
+            drained = False
+            while lines:
+                drained = True
+                name, line = lines.popleft()
+                if line is None:
+                    pending -= 1
+                    continue
+                batch.append((name, line))
+            if batch:
+                yield batch
+            elif not drained and self.proc.poll() is not None:
+                # 与selector路径一致：codex已退出但管道仍被其子进程持有时，不再无限等待EOF
+                break
+
+    def shutdown(self) -> None:
+        # 消费方提前退出（如用户挂断）时终止codex，限时等待，超时则强杀
+        if self.alive():
+            try:
+                self.proc.terminate()
+                self.proc.wait(timeout=_SHUTDOWN_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.kill()
+            except Exception:
+                pass
+        self.close_pipes()
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def kill(self) -> None:
+        if self.alive():
+            try:
+                self.proc.kill()
+                self.proc.wait(timeout=1)
+            except Exception:
+                pass
+        self.close_pipes()
+
+    def close_pipes(self) -> None:
+        # 显式关闭管道，及时释放文件描述符，不等垃圾回收
+        for stream in (self.proc.stdin, self.proc.stdout, self.proc.stderr):
+            if stream:
+                try:
+                    stream.close()
+                except Exception:
+                    pass
+
+
+class _WorkerPool:
+    """Pre-started codex processes waiting for their prompt on stdin.
+
+    `codex exec` runs a single turn per process (the prompt ends at stdin EOF),
+    so a worker cannot be reused across turns. Instead the pool keeps a warm
+    process per command so the next turn skips process and CLI startup.
+    """
+
+    def __init__(self, spawn, max_idle: int, idle_timeout: float):
+        # 只弱引用provider的spawn方法，池子和回收定时器不会让provider无法被回收
+        self._spawn_ref = weakref.WeakMethod(spawn)
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def _spawn(self, command: list) -> _CodexWorker:
+        spawn = self._spawn_ref()
+        if spawn is None:
+            raise RuntimeError("Codex provider has been released")
+        return spawn(command)
+
+    def acquire(self, command: list) -> _CodexWorker:
+        key = tuple(command)
+        worker = None
+        with self._lock:
+            for i, candidate in enumerate(self._idle):
+                if candidate.key == key:
+                    worker = self._idle.pop(i)
+                    break
+        if worker is not None:
+            if worker.alive():
+                return worker
+            worker.kill()
+        return self._spawn(command)
+
+    def prewarm(self, command: list) -> None:
+        if self.max_idle <= 0:
+            return
+        key = tuple(command)
+        with self._lock:
+            # 池满时不挤掉仍然有效的预启动进程
+            if len(self._idle) >= self.max_idle or any(
+                w.key == key for w in self._idle
+            ):
+                return
+        try:
+            worker = self._spawn(command)
+        except Exception as e:
+            logger.bind(tag=TAG).warning(f"Failed to prewarm Codex CLI: {e}")
+            return
+        with self._lock:
+            parked = len(self._idle) < self.max_idle and not any(
+                w.key == key for w in self._idle
+            )
+            if parked:
+                self._idle.append(worker)
+                self._schedule_eviction()
+        if not parked:
+            worker.kill()
+
+    def _schedule_eviction(self) -> None:
+        if self._timer is not None or not self._idle or self.idle_timeout <= 0:
+            return
+        delay = self.idle_timeout - (time.monotonic() - self._idle[0].idle_since)
+        self._timer = threading.Timer(max(delay, 0.1), self._evict_idle)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _evict_idle(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._timer = None
+            expired = [
+                w
+                for w in self._idle
+                if not w.alive() or now - w.idle_since >= self.idle_timeout
+            ]
+            self._idle = [w for w in self._idle if w not in expired]
+            self._schedule_eviction()
+        for w in expired:
+            w.kill()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        for w in idle:
+            w.kill()
 
 
 class LLMProvider(LLMProviderBase):
@@ -58,11 +363,42 @@ class LLMProvider(LLMProviderBase):
             "1",
             "yes",
         )
+        self.worker_pool_size = int(config.get("worker_pool_size", 0))
+        self.worker_idle_timeout = float(config.get("worker_idle_timeout", 60))
         self._session_map = {}
         self._session_lock = threading.Lock()
         self._prompt_mode_state = {}
         self._prompt_mode_lock = threading.Lock()
         self._warned_missing_resume = False
+        # 连接关闭时清理该会话的状态，避免两个字典随会话数无限增长
+        register_session_cleanup(self._forget_session)
+        # command/args/env在初始化后不再变化，命令模板和合并后的环境变量只构建一次；
+        # 如需运行时修改self.env，需要同步重建self._env
+        self._init_command_templates()
+        self._env = {**os.environ, **self.env}
+        self._pool = _WorkerPool(
+            self._spawn_worker, self.worker_pool_size, self.worker_idle_timeout
+        )
+        # provider被回收或进程退出时关闭池中的预启动进程
+        weakref.finalize(self, self._pool.close)
+
+    def _forget_session(self, session_id: str) -> None:
+        with self._session_lock:
+            self._session_map.pop(session_id, None)
+        with self._prompt_mode_lock:
+            self._prompt_mode_state.pop(session_id, None)
+
+    def _spawn_worker(self, command: list) -> _CodexWorker:
+        proc = subprocess.Popen(
+            command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            bufsize=0,
+            cwd=self.cwd,
+            env=self._env,
+        )
+        return _CodexWorker(tuple(command), proc)
 
     def _filter_args(self, args):
         filtered = []
@@ -74,48 +410,33 @@ class LLMProvider(LLMProviderBase):
             filtered.append(arg)
         return filtered
 
-    def _build_command(self, resume_id: str = None) -> list:
+    def _init_command_templates(self) -> None:
         args = list(self.args)
-        if resume_id:
-            args = self._filter_args(args)
-            if "--json" not in args:
-                args.append("--json")
-            if self.prompt_via_stdin and "-" not in args:
-                args.append("-")
-            return [self.command, "exec", "resume", resume_id] + args
-
         if not any(arg in ("exec", "e") for arg in args):
             args.insert(0, "exec")
         if "--json" not in args:
             args.append("--json")
         if self.prompt_via_stdin and "-" not in args:
             args.append("-")
-        return [self.command] + args
+        self._base_command = [self.command] + args
+
+        resume_args = self._filter_args(self.args)
+        if "--json" not in resume_args:
+            resume_args.append("--json")
+        if self.prompt_via_stdin and "-" not in resume_args:
+            resume_args.append("-")
+        self._resume_prefix = [self.command, "exec", "resume"]
+        self._resume_suffix = resume_args
+
+    def _build_command(self, resume_id: str = None) -> list:
+        if resume_id:
+            return self._resume_prefix + [resume_id] + self._resume_suffix
+        return self._base_command
 
     def _build_prompt(self, dialogue, prompt_mode: str = None) -> str:
         if prompt_mode is None:
             prompt_mode = self.prompt_mode
-        if prompt_mode == "last_user":
-            for msg in reversed(dialogue):
-                if msg.get("role") == "user":
-                    return msg.get("content", "")
-            return ""
-
-        parts = []
-        for msg in dialogue:
-            role = msg.get("role", "user")
-            content = msg.get("content", "")
-            if content is None:
-                content = ""
-            if role == "system":
-                parts.append(f"System: {content}")
-            elif role == "assistant":
-                parts.append(f"Assistant: {content}")
-            elif role == "tool":
-                parts.append(f"Tool: {content}")
-            else:
-                parts.append(f"User: {content}")
-        return "\n".join(parts)
+        return build_dialogue_prompt(dialogue, prompt_mode)
 
     def _get_effective_prompt_mode(self, session_id: str) -> str:
         if self.prompt_mode != "first_full_then_last":
@@ -128,118 +449,127 @@ class LLMProvider(LLMProviderBase):
             self._warned_missing_resume = True
         if not session_id:
             return "full_dialogue"
-        with self._prompt_mode_lock:
-            if not self._prompt_mode_state.get(session_id):
-                return "full_dialogue"
-            return "last_user"
+        if not self._prompt_mode_state.get(session_id):
+            return "full_dialogue"
+        return "last_user"
 
     def _mark_prompt_sent(self, session_id: str) -> None:
         if self.prompt_mode != "first_full_then_last":
             return
         if not session_id:
             return
+        if self._prompt_mode_state.get(session_id):
+            return
+        # 只有写入加锁；单次dict读取在GIL下是原子的，读取方无需加锁
         with self._prompt_mode_lock:
             self._prompt_mode_state[session_id] = True
 
-    def _parse_event(self, line: str):
+    def _parse_event(self, line: bytes):
         if not line:
             return None
         payload = line.strip()
         if not payload:
             return None
-        if payload.startswith("data:"):
+        if payload[:5] == b"data:":
             payload = payload[5:].strip()
+            if not payload:
+                return None
+        # 日志等纯文本行不以JSON起始字符开头，直接返回，省去解析失败的异常开销
+        if payload[0] not in _JSON_START:
+            return payload.decode("utf-8", errors="replace")
         try:
-            return json.loads(payload)
-        except json.JSONDecodeError:
-            return payload
+            return _json_loads(payload)
+        except ValueError:
+            return payload.decode("utf-8", errors="replace")
 
     def _find_uuid(self, value):
-        if not value:
+        # UUID固定36个字符且包含"-"，先做廉价判断，避免对普通文本跑正则
+        if not isinstance(value, str) or len(value) < 36 or "-" not in value:
             return None
-        if isinstance(value, str):
-            match = _UUID_RE.search(value)
-            return match.group(0) if match else None
-        return None
+        match = _UUID_RE.search(value)
+        return match.group(0) if match else None
+
+    def _is_content_event(self, event: dict) -> bool:
+        event_type = event.get("type")
+        return isinstance(event_type, str) and (
+            event_type in _NO_SESSION_TYPES or event_type.endswith(".delta")
+        )
 
     def _extract_session_id(self, event):
         if not event:
             return None
-        if isinstance(event, str):
-            return self._find_uuid(event)
-
-        if isinstance(event, dict):
-            for key in (
-                "session_id",
-                "sessionId",
-                "conversation_id",
-                "conversationId",
-                "session",
-                "conversation",
-            ):
-                candidate = self._extract_session_id(event.get(key))
+        if isinstance(event, dict) and self._is_content_event(event):
+            return None
+        stack = [event]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, str):
+                candidate = self._find_uuid(value)
                 if candidate:
                     return candidate
-            candidate = self._extract_session_id(event.get("id"))
+            elif isinstance(value, list):
+                stack.extend(reversed(value))
+            elif isinstance(value, dict):
+                if self._is_content_event(value):
+                    continue
+                for key in _SESSION_KEYS_REVERSED:
+                    candidate = value.get(key)
+                    if candidate:
+                        stack.append(candidate)
+        # 常见键名都没有命中时，退回到扫描事件里的全部字符串
+        for value in self._walk_strings(event):
+            candidate = self._find_uuid(value)
             if candidate:
                 return candidate
-            return self._find_uuid(json.dumps(event, ensure_ascii=False))
-
-        if isinstance(event, list):
-            for item in event:
-                candidate = self._extract_session_id(item)
-                if candidate:
-                    return candidate
         return None
 
+    def _walk_strings(self, value):
+        stack = [value]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, str):
+                yield value
+            elif isinstance(value, dict):
+                # 与上面的键名查找一致，内容类事件里的UUID不是会话id
+                if self._is_content_event(value):
+                    continue
+                stack.extend(reversed(value.values()))
+            elif isinstance(value, list):
+                stack.extend(reversed(value))
+
     def _store_session_id(self, session_id: str, event) -> None:
         if not session_id or not event:
             return
         candidate = self._extract_session_id(event)
         if not candidate:
             return
+        if self._session_map.get(session_id) == candidate:
+            return
         with self._session_lock:
             self._session_map[session_id] = candidate
 
     def _get_resume_id(self, session_id: str):
         if not session_id:
             return None
-        with self._session_lock:
-            return self._session_map.get(session_id)
+        return self._session_map.get(session_id)
 
     def _collect_text(self, value, items):
-        if value is None:
-            return
-        if isinstance(value, str):
-            if value:
-                items.append(value)
-            return
-        if isinstance(value, list):
-            for item in value:
-                self._collect_text(item, items)
-            return
-        if isinstance(value, dict):
-            for key in (
-                "text",
-                "content",
-                "message",
-                "output",
-                "delta",
-                "data",
-                "response",
-                "result",
-                "final",
-            ):
-                if key in value:
-                    self._collect_text(value[key], items)
-            return
+        stack = [value]
+        while stack:
+            value = stack.pop()
+            if value is None:
+                continue
+            if isinstance(value, str):
+                if value:
+                    items.append(value)
+            elif isinstance(value, list):
+                stack.extend(reversed(value))
+            elif isinstance(value, dict):
+                for key in _TEXT_KEYS_REVERSED:
+                    if key in value:
+                        stack.append(value[key])
 
     def _extract_codex_item_text(self, event):
-        if not isinstance(event, dict):
-            return []
-        event_type = event.get("type", "")
-        if not event_type.startswith("item."):
-            return []
         item = event.get("item") or event.get("delta") or {}
         if not isinstance(item, dict):
             return []
@@ -287,28 +617,59 @@ class LLMProvider(LLMProviderBase):
                 messages.append(f"[codex.command.output] {output}")
         return messages
 
+    def _extract_delta_text(self, event):
+        # 最常见的增量事件delta就是一段字符串，直接返回，无需遍历
+        delta = event.get("delta")
+        if delta and isinstance(delta, str):
+            return [delta]
+        items = []
+        self._collect_text(event.get("delta") or event.get("text"), items)
+        return items
+
+    def _extract_error_text(self, event):
+        items = []
+        self._collect_text(event.get("error") or event.get("message"), items)
+        return items
+
+    def _extract_event_text(self, event):
+        items = []
+        self._collect_text(event, items)
+        return items
+
+    @staticmethod
+    def _classify_event_type(event_type: str):
+        if event_type.endswith(".delta"):
+            handler = LLMProvider._extract_delta_text
+        elif event_type.endswith(".error"):
+            handler = LLMProvider._extract_error_text
+        else:
+            handler = LLMProvider._extract_event_text
+        if event_type.startswith("item."):
+            fallback = handler
+
+            def handler(provider, event):
+                return provider._extract_codex_item_text(event) or fallback(
+                    provider, event
+                )
+
+        if len(_HANDLER_CACHE) < _HANDLER_CACHE_MAX:
+            _HANDLER_CACHE[event_type] = handler
+        return handler
+
     def _extract_text_chunks(self, event):
         if event is None:
             return []
         if isinstance(event, str):
             return [event]
-
-        items = []
-        if isinstance(event, dict):
-            codex_items = self._extract_codex_item_text(event)
-            if codex_items:
-                return codex_items
-            event_type = event.get("type")
-            if event_type:
-                if event_type.endswith(".delta") or event_type.endswith(".text.delta"):
-                    self._collect_text(event.get("delta") or event.get("text"), items)
-                elif event_type.endswith(".error"):
-                    self._collect_text(event.get("error") or event.get("message"), items)
-                else:
-                    self._collect_text(event, items)
-            else:
-                self._collect_text(event, items)
-        return items
+        if not isinstance(event, dict):
+            return []
+        event_type = event.get("type")
+        if not event_type or not isinstance(event_type, str):
+            return self._extract_event_text(event)
+        handler = _HANDLER_CACHE.get(event_type) or self._classify_event_type(
+            event_type
+        )
+        return handler(self, event)
 
     def _event_to_text(self, event) -> str:
         chunks = self._extract_text_chunks(event)
@@ -324,21 +685,11 @@ class LLMProvider(LLMProviderBase):
         if not self.prompt_via_stdin and prompt:
             command = command + [prompt]
 
-        env = os.environ.copy()
-        env.update(self.env)
-
         try:
-            proc = subprocess.Popen(
-                command,
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding="utf-8",
-                errors="replace",
-                cwd=self.cwd,
-                env=env,
-            )
+            if self.prompt_via_stdin:
+                worker = self._pool.acquire(command)
+            else:
+                worker = self._spawn_worker(command)
         except FileNotFoundError:
             logger.bind(tag=TAG).error("Codex CLI not found in PATH.")
             yield "[Codex CLI error: command not found]"
@@ -350,108 +701,118 @@ class LLMProvider(LLMProviderBase):
         if effective_prompt_mode == "full_dialogue":
             self._mark_prompt_sent(session_id)
 
+        proc = worker.proc
         if self.prompt_via_stdin and proc.stdin:
             try:
-                proc.stdin.write(prompt)
+                data = memoryview(prompt.encode("utf-8"))
+                while data:
+                    data = data[proc.stdin.write(data) :]
                 proc.stdin.close()
             except Exception as e:
                 logger.bind(tag=TAG).error(f"Failed to write prompt: {e}")
 
-        queue = Queue()
-
-        def reader(stream, name):
-            for line in iter(stream.readline, ""):
-                queue.put((name, line))
-            queue.put((name, None))
-
-        threads = []
-        if proc.stdout:
-            threads.append(threading.Thread(target=reader, args=(proc.stdout, "stdout"), daemon=True))
-        if proc.stderr:
-            threads.append(threading.Thread(target=reader, args=(proc.stderr, "stderr"), daemon=True))
-        for t in threads:
-            t.start()
-
-        stdout_done = False
-        stderr_done = False
+        batches = worker.read_batches()
+        finished = False
+        failed = False
         stdout_started = False
         abort_blocked = False
         last_summary = None
         last_summary_time = 0.0
+        stderr_seen = OrderedDict()
 
         try:
-            while not (stdout_done and stderr_done):
-                try:
-                    name, line = queue.get(timeout=0.1)
-                except Empty:
-                    if proc.poll() is not None and stdout_done and stderr_done:
-                        break
-                    continue
-
-                if line is None:
-                    if name == "stdout":
-                        stdout_done = True
-                    elif name == "stderr":
-                        stderr_done = True
-                    continue
-
-                event = self._parse_event(line)
-                if event is not None:
-                    self._store_session_id(session_id, event)
-                if name == "stderr":
-                    if stdout_started or not self.stderr_summary_enabled:
-                        continue
-                    stderr_text = self._event_to_text(event)
-                    if not stderr_text:
-                        continue
-                    summary = summarize(stderr_text)
-                    if not summary:
-                        continue
-                    summary = summary.strip()
-                    if not summary:
+            for batch in batches:
+                # 同批已就绪的文本增量先攒起来，状态/调试输出前或超过合并窗口时再整体yield
+                pending = []
+                deadline = time.monotonic() + _COALESCE_WINDOW
+                for name, line in batch:
+                    if name == "stderr":
+                        if stdout_started or not self.stderr_summary_enabled:
+                            continue
+                        # 心跳/进度类日志会原样重复，已展示过的行在解析和摘要之前直接丢弃
+                        if line in stderr_seen:
+                            stderr_seen.move_to_end(line)
+                            continue
+                        stderr_text = self._event_to_text(self._parse_event(line))
+                        if not stderr_text:
+                            continue
+                        summary = (summarize(stderr_text) or "").strip()
+                        if not summary:
+                            continue
+                        now = time.monotonic()
+                        if (
+                            self.stderr_summary_min_interval > 0
+                            and now - last_summary_time
+                            < self.stderr_summary_min_interval
+                        ):
+                            continue
+                        if summary == last_summary:
+                            continue
+                        if not abort_blocked:
+                            block_abort(session_id)
+                            abort_blocked = True
+                        last_summary = summary
+                        last_summary_time = now
+                        # 只记录真正展示过的行；被限频或摘要为空的行之后仍可展示
+                        stderr_seen[line] = None
+                        if len(stderr_seen) > _STDERR_SEEN_MAX:
+                            stderr_seen.popitem(last=False)
+                        if pending:
+                            yield "".join(pending)
+                            pending.clear()
+                        yield wrap_status(summary)
                         continue
-                    now = time.monotonic()
-                    if (
-                        self.stderr_summary_min_interval > 0
-                        and now - last_summary_time < self.stderr_summary_min_interval
-                    ):
-                        continue
-                    if summary == last_summary:
-                        continue
-                    if not abort_blocked:
-                        block_abort(session_id)
-                        abort_blocked = True
-                    last_summary = summary
-                    last_summary_time = now
-                    yield wrap_status(summary)
-                    continue
 
-                if name != "stderr":
+                    event = self._parse_event(line)
+                    if event is not None:
+                        self._store_session_id(session_id, event)
                     for debug_text in self._format_debug_event(event):
                         if self.debug_event_target == "status":
+                            if pending:
+                                yield "".join(pending)
+                                pending.clear()
                             yield wrap_status(debug_text)
                         else:
                             logger.bind(tag=TAG).info(debug_text)
 
-                for chunk in self._extract_text_chunks(event):
-                    if not chunk:
-                        continue
-                    if not stdout_started:
-                        stdout_started = True
-                        if abort_blocked:
-                            unblock_abort(session_id)
-                            abort_blocked = False
-                    yield chunk
-
-            exit_code = proc.wait()
-            if exit_code != 0 and not stdout_started:
+                    for chunk in self._extract_text_chunks(event):
+                        if not chunk:
+                            continue
+                        if not stdout_started:
+                            stdout_started = True
+                            if abort_blocked:
+                                unblock_abort(session_id)
+                                abort_blocked = False
+                        pending.append(chunk)
+                    if pending and time.monotonic() >= deadline:
+                        yield "".join(pending)
+                        pending.clear()
+                        deadline = time.monotonic() + _COALESCE_WINDOW
+                if pending:
+                    yield "".join(pending)
+
+            finished = True
+            try:
+                exit_code = proc.wait(timeout=_SHUTDOWN_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                worker.kill()
+                exit_code = proc.returncode
+            failed = exit_code != 0
+            if failed and not stdout_started:
                 logger.bind(tag=TAG).error(f"Codex CLI exited with code {exit_code}")
                 yield f"[Codex CLI error: exit code {exit_code}]"
         finally:
             if abort_blocked:
                 unblock_abort(session_id)
-            for t in threads:
-                t.join(timeout=1)
+            batches.close()
+            if finished:
+                worker.close_pipes()
+            else:
+                worker.shutdown()
+            # 只预启动与会话无关的基础命令：resume命令带着本会话的id，别的会话用不上；
+            # 本轮CLI出错时也不预启动，避免反复拉起同样会失败的进程
+            if self.prompt_via_stdin and not failed:
+                self._pool.prewarm(self._base_command)
 
     def response_with_functions(self, session_id, dialogue, functions=None, **kwargs):
         for chunk in self.response(session_id, dialogue, **kwargs):
@@ -1,29 +1,116 @@
 import asyncio
+import concurrent.futures
 import os
 import threading
+from collections import OrderedDict, deque
 from typing import Any, Dict, Optional, Tuple
 
 from config.logger import setup_logging
 from core.providers.llm.base import LLMProviderBase
 from core.providers.tools.server_mcp.mcp_client import ServerMCPClient
+from core.utils.llm_prompt import build_dialogue_prompt
+from core.utils.llm_runtime import register_session_cleanup
 
 TAG = __name__
 logger = setup_logging()
 
 
+class _LRU:
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, Any]" = OrderedDict()
+
+    def get(self, key: str, default=None):
+        if key not in self._data:
+            return default
+        self._data.move_to_end(key)
+        return self._data[key]
+
+    def __setitem__(self, key: str, value) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.maxsize > 0 and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: str, default=None):
+        return self._data.pop(key, default)
+
+
+class _Waiter:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+    def reset(self) -> None:
+        self.event.clear()
+        self.result = None
+        self.error = None
+
+
 class _LoopRunner:
     def __init__(self) -> None:
         self.loop = asyncio.new_event_loop()
         self.thread = threading.Thread(target=self._run, daemon=True)
         self.thread.start()
+        # 复用等待对象，避免每次调用都分配concurrent.futures.Future
+        self._waiters = deque()
 
     def _run(self) -> None:
         asyncio.set_event_loop(self.loop)
         self.loop.run_forever()
 
-    def run(self, coro, timeout: Optional[float] = None):
-        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
-        return future.result(timeout)
+    def submit(self, coro) -> concurrent.futures.Future:
+        # 一次性的后台任务（如提前初始化）直接拿Future，调用方稍后再限时等待
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro):
+        try:
+            waiter = self._waiters.pop()
+        except IndexError:
+            waiter = _Waiter()
+
+        def on_done(task: asyncio.Task) -> None:
+            if task.cancelled():
+                waiter.error = concurrent.futures.CancelledError()
+            else:
+                waiter.error = task.exception()
+                if waiter.error is None:
+                    waiter.result = task.result()
+            waiter.event.set()
+
+        def start() -> None:
+            try:
+                task = self.loop.create_task(coro)
+            except BaseException as e:
+                waiter.error = e
+                waiter.event.set()
+                return
+            task.add_done_callback(on_done)
+
+        self.loop.call_soon_threadsafe(start)
+        waiter.event.wait()
+        result, error = waiter.result, waiter.error
+        waiter.reset()
+        self._waiters.append(waiter)
+        if error is not None:
+            raise error
+        return result
+
+
+# 所有provider实例共用一个事件循环线程，实例再多也只有一个loop线程
+_shared_loop: Optional[_LoopRunner] = None
+_shared_loop_lock = threading.Lock()
+
+
+def _get_shared_loop() -> _LoopRunner:
+    global _shared_loop
+    with _shared_loop_lock:
+        if _shared_loop is None:
+            _shared_loop = _LoopRunner()
+        return _shared_loop
 
 
 class LLMProvider(LLMProviderBase):
@@ -31,6 +118,7 @@ class LLMProvider(LLMProviderBase):
         self.command = config.get("command", "codex.cmd")
         self.args = list(config.get("args") or ["mcp-server"])
         self.env = config.get("env") or {}
+        self._env = {**os.environ, **self.env}
         self.cwd = config.get("cwd") or config.get("workdir")
         self.prompt_mode = config.get("prompt_mode", "full_dialogue")
         self.resume_session = str(config.get("resume_session", False)).lower() in (
@@ -39,6 +127,11 @@ class LLMProvider(LLMProviderBase):
             "yes",
         )
         self.init_timeout = float(config.get("init_timeout", 20))
+        self.eager_init = str(config.get("eager_init", False)).lower() in (
+            "true",
+            "1",
+            "yes",
+        )
 
         self.sandbox = config.get("sandbox")
         self.approval_policy = config.get("approval_policy") or config.get(
@@ -54,30 +147,65 @@ class LLMProvider(LLMProviderBase):
         )
         self.compact_prompt = config.get("compact_prompt") or config.get("compact-prompt")
         self.codex_config = config.get("config")
+        # 以上配置在初始化后不再变化，codex工具的启动参数只构建一次
+        self._init_start_args_template()
 
         self._client: Optional[ServerMCPClient] = None
         self._client_lock = threading.Lock()
         self._loop_runner: Optional[_LoopRunner] = None
+        self._pending_client: Optional[ServerMCPClient] = None
+        self._init_future: Optional[concurrent.futures.Future] = None
 
-        self._session_map: Dict[str, str] = {}
+        # 按会话保存的状态设置容量上限，长期运行时不会无限增长；连接关闭时也会主动清理
+        self.session_cache_size = int(config.get("session_cache_size", 4096))
+        self._session_map = _LRU(self.session_cache_size)
         self._session_lock = threading.Lock()
-        self._prompt_mode_state: Dict[str, bool] = {}
+        self._prompt_mode_state = _LRU(self.session_cache_size)
         self._prompt_mode_lock = threading.Lock()
         self._warned_missing_resume = False
+        register_session_cleanup(self._forget_session)
+
+        if self.eager_init:
+            # 在共享事件循环上提前发起初始化但不等待，构造不阻塞调用线程；
+            # 首次调用时在_ensure_client中等待结果
+            with self._client_lock:
+                self._start_client_init()
+
+    def _forget_session(self, session_id: str) -> None:
+        with self._session_lock:
+            self._session_map.pop(session_id)
+        with self._prompt_mode_lock:
+            self._prompt_mode_state.pop(session_id)
+
+    def _start_client_init(self) -> None:
+        # 需持有self._client_lock调用
+        if not self._loop_runner:
+            self._loop_runner = _get_shared_loop()
+        client_config = {
+            "command": self.command,
+            "args": self.args,
+            "env": self._env,
+        }
+        client = ServerMCPClient(client_config)
+        self._pending_client = client
+        self._init_future = self._loop_runner.submit(client.initialize())
 
     def _ensure_client(self) -> ServerMCPClient:
-        if self._client:
-            return self._client
+        # 调用方已先读过self._client，这里只在加锁后再确认一次
         with self._client_lock:
             if self._client:
                 return self._client
-            if not self._loop_runner:
-                self._loop_runner = _LoopRunner()
-            env = os.environ.copy()
-            env.update(self.env)
-            client_config = {"command": self.command, "args": self.args, "env": env}
-            client = ServerMCPClient(client_config)
-            self._loop_runner.run(client.initialize(), timeout=self.init_timeout)
+            if self._init_future is None:
+                self._start_client_init()
+            future, client = self._init_future, self._pending_client
+            self._init_future = None
+            self._pending_client = None
+            try:
+                future.result(timeout=self.init_timeout)
+            except BaseException:
+                # 失败或超时后丢弃本次初始化，下次调用重新发起
+                future.cancel()
+                raise
             self._client = client
             return client
 
@@ -106,27 +234,7 @@ class LLMProvider(LLMProviderBase):
             self._prompt_mode_state[session_id] = True
 
     def _build_prompt(self, dialogue, prompt_mode: str) -> str:
-        if prompt_mode == "last_user":
-            for msg in reversed(dialogue):
-                if msg.get("role") == "user":
-                    return msg.get("content", "")
-            return ""
-
-        parts = []
-        for msg in dialogue:
-            role = msg.get("role", "user")
-            content = msg.get("content", "")
-            if content is None:
-                content = ""
-            if role == "system":
-                parts.append(f"System: {content}")
-            elif role == "assistant":
-                parts.append(f"Assistant: {content}")
-            elif role == "tool":
-                parts.append(f"Tool: {content}")
-            else:
-                parts.append(f"User: {content}")
-        return "\n".join(parts)
+        return build_dialogue_prompt(dialogue, prompt_mode)
 
     def _store_thread_id(self, session_id: str, thread_id: str) -> None:
         if not session_id or not thread_id:
@@ -140,7 +248,10 @@ class LLMProvider(LLMProviderBase):
         with self._session_lock:
             return self._session_map.get(session_id)
 
-    def _extract_text(self, result) -> str:
+    def _extract(self, result) -> Tuple[str, Optional[str]]:
+        # 一次遍历structuredContent同时取出回复文本和threadId
+        text = ""
+        thread_id = None
         structured = getattr(result, "structuredContent", None)
         if structured is None and isinstance(result, dict):
             structured = result.get("structuredContent")
@@ -148,7 +259,15 @@ class LLMProvider(LLMProviderBase):
             for key in ("content", "message", "text", "output"):
                 value = structured.get(key)
                 if isinstance(value, str) and value:
-                    return value
+                    text = value
+                    break
+            for key in ("threadId", "thread_id", "session_id", "conversationId"):
+                value = structured.get(key)
+                if isinstance(value, str) and value:
+                    thread_id = value
+                    break
+        if text:
+            return text, thread_id
 
         content = getattr(result, "content", None)
         if content is None and isinstance(result, dict):
@@ -156,50 +275,40 @@ class LLMProvider(LLMProviderBase):
         if isinstance(content, list):
             parts = []
             for item in content:
-                text = getattr(item, "text", None)
-                if text is None and isinstance(item, dict):
-                    text = item.get("text")
-                if isinstance(text, str) and text:
-                    parts.append(text)
-            return "".join(parts)
-        return ""
-
-    def _extract_thread_id(self, result) -> Optional[str]:
-        structured = getattr(result, "structuredContent", None)
-        if structured is None and isinstance(result, dict):
-            structured = result.get("structuredContent")
-        if isinstance(structured, dict):
-            for key in ("threadId", "thread_id", "session_id", "conversationId"):
-                value = structured.get(key)
-                if isinstance(value, str) and value:
-                    return value
-        return None
+                item_text = getattr(item, "text", None)
+                if item_text is None and isinstance(item, dict):
+                    item_text = item.get("text")
+                if isinstance(item_text, str) and item_text:
+                    parts.append(item_text)
+            text = "".join(parts)
+        return text, thread_id
 
-    def _build_start_args(self, prompt: str) -> Dict[str, Any]:
-        args: Dict[str, Any] = {"prompt": prompt}
-        if self.approval_policy:
-            args["approval-policy"] = self.approval_policy
-        if self.sandbox:
-            args["sandbox"] = self.sandbox
-        if self.model:
-            args["model"] = self.model
-        if self.profile:
-            args["profile"] = self.profile
-        if self.base_instructions:
-            args["base-instructions"] = self.base_instructions
-        if self.developer_instructions:
-            args["developer-instructions"] = self.developer_instructions
-        if self.compact_prompt:
-            args["compact-prompt"] = self.compact_prompt
+    def _init_start_args_template(self) -> None:
+        template: Dict[str, Any] = {
+            key: value
+            for key, value in (
+                ("approval-policy", self.approval_policy),
+                ("sandbox", self.sandbox),
+                ("model", self.model),
+                ("profile", self.profile),
+                ("base-instructions", self.base_instructions),
+                ("developer-instructions", self.developer_instructions),
+                ("compact-prompt", self.compact_prompt),
+            )
+            if value
+        }
         if isinstance(self.codex_config, dict):
-            args["config"] = self.codex_config
+            template["config"] = self.codex_config
         if self.cwd:
-            args["cwd"] = self.cwd
-        return args
+            template["cwd"] = self.cwd
+        self._start_args_template = template
+
+    def _build_start_args(self, prompt: str) -> Dict[str, Any]:
+        return {"prompt": prompt, **self._start_args_template}
 
     def response(self, session_id, dialogue, **kwargs):
         try:
-            client = self._ensure_client()
+            client = self._client or self._ensure_client()
         except Exception as e:
             logger.bind(tag=TAG).error(f"Failed to initialize Codex MCP client: {e}")
             yield "[Codex MCP error: failed to initialize]"
@@ -217,16 +326,13 @@ class LLMProvider(LLMProviderBase):
                 tool_name = "codex"
                 tool_args = self._build_start_args(prompt)
 
-            result = self._loop_runner.run(
-                client.call_tool(tool_name, tool_args), timeout=None
-            )
-            new_thread_id = self._extract_thread_id(result)
+            result = self._loop_runner.run(client.call_tool(tool_name, tool_args))
+            text, new_thread_id = self._extract(result)
             if new_thread_id:
                 self._store_thread_id(session_id, new_thread_id)
             if prompt_mode == "full_dialogue":
                 self._mark_prompt_sent(session_id)
 
-            text = self._extract_text(result)
             if text:
                 yield text
             else:
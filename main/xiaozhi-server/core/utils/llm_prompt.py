@@ -0,0 +1,35 @@
+_ROLE_PREFIX = {
+    "system": "System: ",
+    "assistant": "Assistant: ",
+    "tool": "Tool: ",
+    "user": "User: ",
+}
+
+
+def _content_text(content) -> str:
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    return str(content)
+
+
+def build_dialogue_prompt(dialogue, prompt_mode: str) -> str:
+    """把对话拼成单条文本提示词；last_user只取最后一条用户消息"""
+    if prompt_mode == "last_user":
+        return next(
+            (
+                msg.get("content", "")
+                for msg in reversed(dialogue)
+                if msg.get("role") == "user"
+            ),
+            "",
+        )
+
+    return "\n".join(
+        [
+            _ROLE_PREFIX.get(msg.get("role", "user"), "User: ")
+            + _content_text(msg.get("content"))
+            for msg in dialogue
+        ]
+    )
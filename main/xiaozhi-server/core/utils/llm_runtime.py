@@ -1,29 +1,43 @@
-import threading
+import weakref
 
-_abort_blocked = {}
-_lock = threading.Lock()
+# 被阻止打断的会话集合。读多写少，set的add/discard/in在GIL下都是原子操作，无需加锁
+_abort_blocked = set()
+# 会话结束时需要通知的清理回调，弱引用持有，不影响provider实例被回收
+_session_cleanups = []
 
 
 def block_abort(session_id: str) -> None:
     if not session_id:
         return
-    with _lock:
-        _abort_blocked[session_id] = True
+    _abort_blocked.add(session_id)
 
 
 def unblock_abort(session_id: str) -> None:
     if not session_id:
         return
-    with _lock:
-        _abort_blocked.pop(session_id, None)
+    _abort_blocked.discard(session_id)
 
 
 def is_abort_blocked(session_id: str) -> bool:
     if not session_id:
         return False
-    with _lock:
-        return _abort_blocked.get(session_id, False)
+    return session_id in _abort_blocked
+
+
+def register_session_cleanup(callback) -> None:
+    _session_cleanups.append(weakref.WeakMethod(callback))
 
 
 def clear_session(session_id: str) -> None:
     unblock_abort(session_id)
+    if not session_id:
+        return
+    for ref in list(_session_cleanups):
+        callback = ref()
+        if callback is None:
+            try:
+                _session_cleanups.remove(ref)
+            except ValueError:
+                pass
+            continue
+        callback(session_id)
@@ -1,15 +1,16 @@
 STATUS_PREFIX = "[[status]]"
+_PREFIX_LEN = len(STATUS_PREFIX)
 
 
 def wrap_status(text: str) -> str:
     if not text:
         return ""
-    return f"{STATUS_PREFIX}{text}"
+    return STATUS_PREFIX + text
 
 
 def extract_status(content: str):
     if not content:
         return None
     if content.startswith(STATUS_PREFIX):
-        return content[len(STATUS_PREFIX):].lstrip()
+        return content[_PREFIX_LEN:].lstrip()
     return None